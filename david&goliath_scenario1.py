@@ -4,6 +4,9 @@ import AoE2ScenarioParser.helper.bytes_conversions
 _original_int_to_bytes = AoE2ScenarioParser.helper.bytes_conversions.int_to_bytes
 
 def _patched_int_to_bytes(integer, length, endian='little', signed=True):
+    # Plain ints are almost every call - skip the enum/string checks for them
+    if type(integer) is int:
+        return _original_int_to_bytes(integer, length, endian, signed)
     # Convert enums to their integer value
     if hasattr(integer, 'value') and hasattr(integer, 'name'):  # It's an Enum
         integer = integer.value
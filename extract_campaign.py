@@ -5,8 +5,49 @@ Based on rge_campaign format documentation
 import struct
 import os
 import sys
+import mmap
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from contextlib import ExitStack
 
 RGE_STRING_ID = 0x0A60
+MAX_EXTRACT_WORKERS = 8
+
+# Resolved once - avoids the codec lookup and keyword handling of bytes.decode
+_utf8_decode = codecs.getdecoder('utf-8')
+
+
+def _extract_one(mm, output_dir, scenario):
+    """Write a single scenario blob from the mapped campaign file"""
+    out_path = os.path.join(output_dir, scenario['filename'])
+    start = scenario['offset']
+    with memoryview(mm) as view, open(out_path, 'wb') as out_f:
+        out_f.write(view[start:start + scenario['size']])
+    return out_path
+
+
+class _SequentialExtractor:
+    """Fallback for files that cannot be mapped - reads blobs one at a time"""
+
+    def __init__(self, f, output_dir):
+        self.f = f
+        self.output_dir = output_dir
+        self.cursor = f.tell()
+
+    def __call__(self, scenario):
+        # Blobs are normally stored back-to-back, so after each read the file
+        # pointer already sits on the next offset and the seek can be skipped
+        if self.cursor != scenario['offset']:
+            self.f.seek(scenario['offset'])
+        data = self.f.read(scenario['size'])
+        self.cursor = scenario['offset'] + len(data)
+
+        out_path = os.path.join(self.output_dir, scenario['filename'])
+        with open(out_path, 'wb') as out_f:
+            out_f.write(data)
+        return out_path
+
 
 def extract_campaign(campaign_path, output_dir=None):
     """Extract all scenarios from an .aoe2campaign file"""
@@ -38,7 +79,8 @@ def extract_campaign(campaign_path, output_dir=None):
 
         # Read campaign name (256 bytes, null terminated)
         name_bytes = f.read(256)
-        campaign_name = name_bytes.split(b'\x00')[0].decode('utf-8', errors='replace')
+        end = name_bytes.find(b'\x00')
+        campaign_name = _utf8_decode(name_bytes[:end if end >= 0 else 256], 'replace')[0]
         print(f"Campaign Name: {campaign_name}")
 
         # Read scenario count
@@ -46,55 +88,63 @@ def extract_campaign(campaign_path, output_dir=None):
         print(f"Scenario count: {scenario_count}")
         print()
 
-        # Read scenario headers
-        scenarios = []
-        for i in range(scenario_count):
-            # Size and offset
-            size = struct.unpack('<I', f.read(4))[0]
-            offset = struct.unpack('<I', f.read(4))[0]
-
-            # String ID check
-            string_id = struct.unpack('<H', f.read(2))[0]
-            if string_id != RGE_STRING_ID:
-                print(f"Warning: Unexpected string ID {hex(string_id)}")
-
-            # Scenario name
-            name_len = struct.unpack('<H', f.read(2))[0]
-            name = f.read(name_len).decode('utf-8', errors='replace')
-
-            # String ID check
-            string_id = struct.unpack('<H', f.read(2))[0]
-            if string_id != RGE_STRING_ID:
-                print(f"Warning: Unexpected string ID {hex(string_id)}")
-
-            # Filename
-            filename_len = struct.unpack('<H', f.read(2))[0]
-            filename = f.read(filename_len).decode('utf-8', errors='replace')
-
-            scenarios.append({
-                'size': size,
-                'offset': offset,
-                'name': name,
-                'filename': filename
-            })
-
-            print(f"Scenario {i+1}: {name}")
-            print(f"  Filename: {filename}")
-            print(f"  Size: {size:,} bytes")
-            print(f"  Offset: {hex(offset)}")
-
-        print()
-
-        # Extract scenarios
-        for i, scenario in enumerate(scenarios):
-            f.seek(scenario['offset'])
-            data = f.read(scenario['size'])
-
-            out_path = os.path.join(output_dir, scenario['filename'])
-            with open(out_path, 'wb') as out_f:
-                out_f.write(data)
-
-            print(f"Extracted: {out_path}")
+        # Blobs are extracted as soon as their header is parsed, so there is no
+        # second pass over a list of headers
+        with ExitStack() as stack:
+            try:
+                mm = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except (OSError, ValueError):
+                # A single worker keeps the fallback reads in header order
+                blob_f = stack.enter_context(open(campaign_path, 'rb'))
+                extract = _SequentialExtractor(blob_f, output_dir)
+                workers = 1
+            else:
+                # Each scenario goes to its own file, so the writes can
+                # overlap while all threads read from the same mapping
+                extract = partial(_extract_one, mm, output_dir)
+                workers = max(1, min(MAX_EXTRACT_WORKERS, os.cpu_count() or 1, scenario_count))
+            ex = stack.enter_context(ThreadPoolExecutor(max_workers=workers))
+
+            extracted = []
+            for i in range(scenario_count):
+                # Size and offset
+                size = struct.unpack('<I', f.read(4))[0]
+                offset = struct.unpack('<I', f.read(4))[0]
+
+                # String ID check
+                string_id = struct.unpack('<H', f.read(2))[0]
+                if string_id != RGE_STRING_ID:
+                    print(f"Warning: Unexpected string ID {hex(string_id)}")
+
+                # Scenario name
+                name_len = struct.unpack('<H', f.read(2))[0]
+                name = _utf8_decode(f.read(name_len), 'replace')[0]
+
+                # String ID check
+                string_id = struct.unpack('<H', f.read(2))[0]
+                if string_id != RGE_STRING_ID:
+                    print(f"Warning: Unexpected string ID {hex(string_id)}")
+
+                # Filename
+                filename_len = struct.unpack('<H', f.read(2))[0]
+                filename = _utf8_decode(f.read(filename_len), 'replace')[0]
+
+                print(f"Scenario {i+1}: {name}")
+                print(f"  Filename: {filename}")
+                print(f"  Size: {size:,} bytes")
+                print(f"  Offset: {hex(offset)}")
+
+                extracted.append(ex.submit(extract, {
+                    'size': size,
+                    'offset': offset,
+                    'filename': filename
+                }))
+
+            print()
+
+            # Results are collected in submission order, so the log stays ordered
+            for future in extracted:
+                print(f"Extracted: {future.result()}")
 
     print(f"\nAll {scenario_count} scenarios extracted to: {output_dir}")
     return output_dir
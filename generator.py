@@ -1,25 +1,57 @@
 import os
+import argparse
+import io
+import sys
+import re
+import ast
 import json
+import time
+import asyncio
+import contextlib
+import functools
+import importlib
+import importlib.util
+import atexit
+import builtins
+import hashlib
+import sqlite3
+import tempfile
+import string
+import threading
+import weakref
+import traceback
+import queue
+import subprocess
 import requests
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import Counter
+from typing import Dict, List, Optional, Any, Final, Mapping, Tuple, Iterator, AsyncIterator
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, replace
 import logging
 from pathlib import Path
 
-# AoE2ScenarioParser imports
-from AoE2ScenarioParser.scenarios.aoe2_de_scenario import AoE2DEScenario
-from AoE2ScenarioParser.datasets.players import PlayerId
-from AoE2ScenarioParser.datasets.units import UnitInfo
-from AoE2ScenarioParser.datasets.trigger_lists import *
-from AoE2ScenarioParser.datasets.buildings import BuildingInfo
-from AoE2ScenarioParser.datasets.other import OtherInfo
-from AoE2ScenarioParser.datasets.techs import TechInfo
-from AoE2ScenarioParser.datasets.heroes import HeroInfo
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# JSON encode/decode for request bodies, responses and cache entries - orjson
+# when it is installed, the standard library otherwise
+if orjson is not None:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    _json_loads = json.loads
+
 @dataclass
 class ScenarioConfig:
     """Configuration for scenario generation
@@ -59,39 +91,390 @@ class ScenarioConfig:
     region: str = None  # Geographic region: mediterranean, steppe, northern_europe, desert, east_asia, middle_east
     player_civ: str = None  # Player civilization style: western_european, eastern_european, middle_eastern, central_asian, east_asian
     enemy_civ: str = None  # Enemy civilization style
+    no_cache: bool = False  # Skip the LLM response cache for this scenario
+
+# Seconds a cached response stays valid
+CACHE_MAX_AGE = 30 * 86400
+
+class LLMCache:
+    """On-disk cache of generated code, keyed by a hash of the request payload"""
+
+    def __init__(self, cache_dir: str = ".scenario_cache", max_age: Optional[float] = CACHE_MAX_AGE):
+        self.cache_dir = Path(cache_dir)
+        # Entries older than this many seconds are treated as misses (None keeps them forever)
+        self.max_age = max_age
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._prune()
+        _LLM_CACHES.add(self)
+
+    def _prune(self) -> None:
+        """Delete entries (and abandoned temporary files) older than max_age"""
+        if self.max_age is None:
+            return
+        cutoff = time.time() - self.max_age
+        try:
+            paths = list(self.cache_dir.iterdir())
+        except OSError:
+            return
+        for path in paths:
+            # The directory is shared with ScenarioCache's database, which is left alone
+            if path.suffix in (".json", ".tmp"):
+                with contextlib.suppress(OSError):
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """Return a stable SHA-256 key for a request payload"""
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached code for key, or None on a miss"""
+        path = self.cache_dir / f"{key}.json"
+        try:
+            with open(path, "rb") as f:
+                if self.max_age is not None and time.time() - os.fstat(f.fileno()).st_mtime > self.max_age:
+                    code = None
+                else:
+                    code = _json_loads(f.read())["code"]
+        except (OSError, ValueError, KeyError):
+            code = None
+        with self._lock:
+            self.stats["hits" if code is not None else "misses"] += 1
+        return code
+
+    def set(self, key: str, code: str) -> None:
+        """Store generated code under key"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename it into place, so a concurrent
+        # reader or an interrupted run never sees a half-written entry
+        with tempfile.NamedTemporaryFile("wb", dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+            f.write(_json_dumps({"code": code}))
+        os.replace(f.name, self.cache_dir / f"{key}.json")
+
+    def log_stats(self) -> None:
+        """Log cache hit/miss counts - run for every live cache at interpreter exit"""
+        hits, misses = self.stats["hits"], self.stats["misses"]
+        if hits or misses:
+            logger.info("LLM cache: %d hits, %d misses (%.0f%% hit rate)", hits, misses, 100 * hits / (hits + misses))
+
+# Caches whose stats are logged at exit - weak, so clients that are gone do not keep them alive
+_LLM_CACHES: "weakref.WeakSet[LLMCache]" = weakref.WeakSet()
+
+@atexit.register
+def _log_llm_cache_stats() -> None:
+    """Log the hit rate of each live LLMCache once, at interpreter exit"""
+    for cache in list(_LLM_CACHES):
+        cache.log_stats()
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def _text_vector(text: str) -> Counter:
+    """Bag-of-words term counts used for near-duplicate matching"""
+    return Counter(_WORD_RE.findall(text.lower()))
+
+def _cosine(a: Counter, b: Counter) -> float:
+    """Cosine similarity of two term-count vectors"""
+    dot = sum(count * b[word] for word, count in a.items() if word in b)
+    if not dot:
+        return 0.0
+    norm_a = sum(count * count for count in a.values()) ** 0.5
+    norm_b = sum(count * count for count in b.values()) ** 0.5
+    return dot / (norm_a * norm_b)
+
+def _replace_string_constants(code: str, replacements: Dict[str, str],
+                              output_path: Optional[str] = None) -> Optional[str]:
+    """Replace each string constant in code that equals a key of replacements
+
+    The new value is inserted as its repr(), so quotes and backslashes in it
+    stay valid Python. Only whole constants are replaced; comments,
+    identifiers and longer strings that contain a key are left alone. With
+    output_path, the path passed to every write_to_file() call is replaced
+    too; None is returned if one of them is not a plain string constant.
+    """
+    tree = _parse_scenario_code(code)
+    # Before Python 3.12 the parts of an f-string carry the position of the whole f-string
+    in_fstring = {id(value) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr)
+                  for value in node.values}
+    paths = set()
+    if output_path is not None:
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == "write_to_file"):
+                arg = node.args[0] if node.args else next(
+                    (kw.value for kw in node.keywords if kw.arg == "filename"), None)
+                if not (isinstance(arg, ast.Constant) and isinstance(arg.value, str)):
+                    return None
+                paths.add(id(arg))
+        if not paths:
+            return None
+
+    data = code.encode("utf-8")
+    # AST column offsets count UTF-8 bytes from the start of the line
+    line_starts = [0] + [match.end() for match in re.finditer(rb"\r\n?|\n", data)]
+    spans = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Constant) or not isinstance(node.value, str) or id(node) in in_fstring:
+            continue
+        if id(node) in paths:
+            value = output_path
+        elif node.value in replacements:
+            value = replacements[node.value]
+        else:
+            continue
+        start = line_starts[node.lineno - 1] + node.col_offset
+        end = line_starts[node.end_lineno - 1] + node.end_col_offset
+        spans.append((start, end, repr(value).encode("utf-8")))
+    for start, end, text in sorted(spans, reverse=True):
+        data = data[:start] + text + data[end:]
+    return data.decode("utf-8")
+
+class ScenarioCache:
+    """SQLite cache of generated scenarios that also answers near-duplicate configs
+
+    Entries are grouped by the config fields that shape the generated code
+    (type, difficulty, players, map size, region, civilizations, reference
+    URL). Within a group, a config whose title and description are similar
+    enough to a stored one reuses that scenario's code, instead of making a
+    new API request. String constants equal to the stored title or
+    description are replaced with the new ones, and the write_to_file() path
+    with the config's output path; other text is left as is. Exact
+    matches are answered from memory or the primary key before any
+    similarity scoring.
+    """
 
-class OpenRouterAPI:
-    """Handles communication with OpenRouter API"""
-    
-    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1"):
-        self.api_key = api_key
-        self.base_url = base_url
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://aoe2scenario-generator.com",
-            "X-Title": "AoE2 Scenario Generator"
-        }
-    
-    def generate_scenario_code(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet") -> str:
-        """Generate scenario code using OpenRouter API"""
-        
-        payload = {
-            "model": model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": """You are an expert Age of Empires 2 scenario creator using the AoE2ScenarioParser library.
+    def __init__(self, path: str = ".scenario_cache/scenarios.db", threshold: float = 0.92):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scenarios ("
+                "structure TEXT NOT NULL, title TEXT NOT NULL, description TEXT NOT NULL, code TEXT NOT NULL, "
+                "PRIMARY KEY (structure, title, description))"
+            )
+        # Exact-match tier for entries already read or written by this process
+        self._memory: Dict[Tuple[str, str, str], str] = {}
+
+    @staticmethod
+    def _structure_key(config: ScenarioConfig) -> str:
+        """Config fields that must match exactly for a cached scenario to be reused"""
+        return json.dumps([config.scenario_type, config.difficulty, config.players, config.map_size,
+                           config.region, config.player_civ, config.enemy_civ, config.wikipedia_url])
+
+    def get(self, config: ScenarioConfig) -> Optional[str]:
+        """Return cached code for config or its closest near-duplicate, or None
+
+        The code is rewritten to save to config.output_path.
+        """
+        key = (self._structure_key(config), config.title, config.description)
+        title, description = config.title, config.description
+        code = self._memory.get(key)
+        if code is None:
+            with contextlib.closing(sqlite3.connect(self.path)) as conn:
+                row = conn.execute(
+                    "SELECT code FROM scenarios WHERE structure = ? AND title = ? AND description = ?", key
+                ).fetchone()
+                if row is not None:
+                    code = self._memory[key] = row[0]
+                else:
+                    rows = conn.execute(
+                        "SELECT title, description, code FROM scenarios WHERE structure = ?", (key[0],)
+                    ).fetchall()
+        if code is None:
+            if not rows:
+                return None
+            query = _text_vector(f"{config.title}\n{config.description}")
+            score, title, description, code = max(
+                (_cosine(query, _text_vector(f"{title}\n{description}")), title, description, code)
+                for title, description, code in rows
+            )
+            if score < self.threshold:
+                return None
+            logger.info("Found scenario '%s' for '%s' (similarity %.2f)", title, config.title, score)
+        return self._adapt(code, title, description, config)
+
+    @staticmethod
+    def _adapt(code: str, title: str, description: str, config: ScenarioConfig) -> Optional[str]:
+        """Rewrite stored code for config - its title, description and output path
+
+        Returns None if the result does not pass _check_scenario_code.
+        """
+        # The stored code must parse before its constants can be rewritten
+        problem, _ = _check_scenario_code(code)
+        if problem is None:
+            code = _replace_string_constants(code, {title: config.title, description: config.description},
+                                             config.output_path)
+            if code is None:
+                problem = "write_to_file() is not called with a plain string path"
+            else:
+                problem, _ = _check_scenario_code(code)
+        if problem is not None:
+            logger.info("Not reusing scenario '%s' for '%s': %s", title, config.title, problem)
+            return None
+        return code
+
+    def set(self, config: ScenarioConfig, code: str) -> None:
+        """Store generated code for config"""
+        key = (self._structure_key(config), config.title, config.description)
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scenarios (structure, title, description, code) VALUES (?, ?, ?, ?)",
+                (*key, code)
+            )
+        self._memory[key] = code
+
+class RateLimiter:
+    """Token bucket that keeps requests under a requests-per-minute and tokens-per-minute limit
+
+    Capacity is reserved up front and may go negative, so concurrent callers
+    are spaced out instead of all waking at the same moment.
+    """
+
+    def __init__(self, max_rpm: Optional[float] = None, max_tpm: Optional[float] = None):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._requests = max_rpm or 0.0
+        self._tokens = max_tpm or 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """Claim capacity for one request and return the seconds to wait before sending it"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+
+            delay = 0.0
+            if self.max_rpm:
+                self._requests = min(self.max_rpm, self._requests + elapsed * self.max_rpm / 60) - 1
+                if self._requests < 0:
+                    delay = -self._requests * 60 / self.max_rpm
+            if self.max_tpm:
+                # A single request larger than the whole budget still has to go through
+                tokens = min(tokens, self.max_tpm)
+                self._tokens = min(self.max_tpm, self._tokens + elapsed * self.max_tpm / 60) - tokens
+                if self._tokens < 0:
+                    delay = max(delay, -self._tokens * 60 / self.max_tpm)
+            return delay
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of the given size may be sent"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            logger.debug("Rate limit reached - waiting %.1fs", delay)
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int) -> None:
+        """Async variant of acquire"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            logger.debug("Rate limit reached - waiting %.1fs", delay)
+            await asyncio.sleep(delay)
+
+# Seconds a generated scenario script may run before it is aborted
+EXECUTION_TIMEOUT = 60
+
+# Scenario requests main() keeps in flight at once
+MAX_CONCURRENT_REQUESTS = 6
+
+# Output token budget for a single request
+MAX_TOKENS = 16000
+# Rough output budget per scenario when several are packed into one request
+BATCH_TOKENS_PER_SCENARIO = 4000
+# Most scenarios packed into one request
+BATCH_MAX_SCENARIOS = MAX_TOKENS // BATCH_TOKENS_PER_SCENARIO
+
+# Model used for every request unless routing picks a cheaper one
+DEFAULT_MODEL = "anthropic/claude-3.5-sonnet"
+# Opt-in routing: simpler difficulties try the faster model first and fall
+# back to DEFAULT_MODEL if its code fails validation
+FAST_MODEL = "anthropic/claude-3.5-haiku"
+FAST_MODEL_DIFFICULTIES = frozenset({"easy", "medium"})
+
+# Context windows (prompt plus output tokens) of the models used here;
+# requests to other models are not checked
+MODEL_CONTEXT_TOKENS: Mapping[str, int] = MappingProxyType({
+    "anthropic/claude-3.5-sonnet": 200000,
+    "anthropic/claude-3.5-haiku": 200000,
+    "anthropic/claude-3-opus": 200000,
+    "openai/gpt-4": 8192,
+    "meta-llama/llama-3.1-70b-instruct": 131072,
+    "google/gemini-pro": 32760,
+})
+# Slack left for message framing and the inexact token estimate
+CONTEXT_MARGIN_TOKENS = 256
+
+# The prompt forbids loading template files, so a streamed response using this is abandoned early
+BANNED_CALL = "AoE2DEScenario.from_file("
+
+# Names every generated scenario script has to import
+REQUIRED_IMPORTS = ("AoE2DEScenario", "PlayerId", "UnitInfo", "BuildingInfo")
+
+class _FenceExtractor:
+    """Incrementally locates the first fenced code block of a streamed response
+
+    The one fence grammar used for both streamed and complete responses: the
+    code starts on the line after the first "```" (whatever language tag
+    that line carries) and runs to the next "```", or to the end of the text
+    if the fence is never closed. Text without a complete opening fence line
+    is taken as code as a whole.
+
+    Each delta only rescans the newly arrived text (plus two characters, in
+    case a fence is split across deltas), so the code is delimited as soon as
+    its closing fence arrives instead of after the stream ends.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._scanned = 0
+
+    @property
+    def closed(self) -> bool:
+        """True once the closing fence has been seen"""
+        return self.end is not None
+
+    def feed(self, delta: str) -> None:
+        """Append a streamed delta and advance the fence state"""
+        self.text += delta
+        if self.end is not None:
+            return
+        if self.start is None:
+            fence = self.text.find("```", max(0, self._scanned - 2))
+            if fence < 0:
+                self._scanned = len(self.text)
+                return
+            # Code starts after the fence line, which may still carry a language tag
+            newline = self.text.find("\n", fence + 3)
+            if newline < 0:
+                self._scanned = fence
+                return
+            self.start = self._scanned = newline + 1
+        fence = self.text.find("```", max(self.start, self._scanned - 2))
+        if fence < 0:
+            self._scanned = len(self.text)
+        else:
+            self.end = fence
+
+    def code(self) -> str:
+        """The fenced code (to the end of the text if unterminated), or the whole text"""
+        if self.start is None:
+            return self.text.strip()
+        return self.text[self.start:self.end].strip()
+
+# Shared system prompt - identical for every request, so it is built once and
+# can be served from the provider's prompt cache
+SYSTEM_PROMPT: Final[str] = """You are an expert Age of Empires 2 scenario creator using the AoE2ScenarioParser library.
 
                     Generate complete, runnable Python code that creates an Age of Empires 2 scenario.
 
                     IMPORTANT - Start your code with this EXACT header:
                     ```python
-                    import sys
-                    import io
-                    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-                    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
-
                     from AoE2ScenarioParser.scenarios.aoe2_de_scenario import AoE2DEScenario
                     from AoE2ScenarioParser.datasets.players import PlayerId
                     from AoE2ScenarioParser.datasets.units import UnitInfo
@@ -101,6 +484,7 @@ class OpenRouterAPI:
                     from AoE2ScenarioParser.datasets.heroes import HeroInfo
                     from AoE2ScenarioParser.datasets.other import OtherInfo
                     from AoE2ScenarioParser.datasets.terrains import TerrainId
+                    from scenario_helpers import grid_coords, scatter
                     ```
 
                     IMPORTANT API USAGE - Follow this exact pattern:
@@ -212,6 +596,16 @@ class OpenRouterAPI:
                     scenario.write_to_file("output.aoe2scenario")
                     ```
 
+                    PLACEMENT HELPERS - use these instead of hand-written nested loops:
+                    - grid_coords(x1, y1, x2, y2, step=1) returns every step-th (x, y) tile in the rectangle (inclusive)
+                    - scatter(x1, y1, x2, y2, count, min_dist=2, seed=None) returns up to count random (x, y) tiles at least min_dist apart
+                    ```python
+                    for x, y in scatter(quarter, quarter, center, center, 40, min_dist=2):
+                        unit_manager.add_unit(PlayerId.GAIA, unit_const=OtherInfo.TREE_OAK.ID, x=x, y=y)
+                    for x, y in grid_coords(center - 2, center - 2, center + 2, center + 2):
+                        map_manager.get_tile(x=x, y=y).terrain_id = TerrainId.ROAD.value
+                    ```
+
                     ALWAYS use from_default() to create new scenarios:
                     - scenario = AoE2DEScenario.from_default()
                     - Do NOT use from_file() as template files may not exist
@@ -351,61 +745,644 @@ class OpenRouterAPI:
                                DESERT_SAND, ROAD, FOREST_OAK (use .value property)
 
                     Return ONLY the Python code, no explanations or markdown formatting."""
-                },
+
+@functools.lru_cache(maxsize=4)
+def _make_headers(api_key: str) -> Mapping[str, str]:
+    """Request headers for an API key, built once and shared read-only"""
+    return MappingProxyType({
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://aoe2scenario-generator.com",
+        "X-Title": "AoE2 Scenario Generator"
+    })
+
+class OpenRouterAPI:
+    """Handles communication with OpenRouter API"""
+    
+    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1",
+                 temperature: float = 0.7, cache: Optional[LLMCache] = None,
+                 max_rpm: Optional[float] = None, max_tpm: Optional[float] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.temperature = temperature
+        # Responses are only cached at temperature 0, where they are deterministic
+        if cache is not None:
+            self.cache = cache
+        self.headers = _make_headers(api_key)
+        # One session for all calls so the TCP/TLS connection is reused
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Transient connection failures and overload responses are retried with backoff.
+        # POST is not retried by default, and every API call here is a POST
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=1.5, status_forcelist=[429, 500, 502, 503, 504],
+                              allowed_methods=["POST"])
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Requests are spaced out before they are sent rather than retried after a 429
+        self.limiter = RateLimiter(max_rpm, max_tpm)
+        # Per model, when a response first confirmed the prompt prefix is cached
+        self._prefix_cached_at: Dict[str, float] = {}
+    
+    @functools.cached_property
+    def cache(self) -> LLMCache:
+        """Response cache, created on first use - only temperature-0 requests touch it"""
+        return LLMCache()
+
+    def close(self) -> None:
+        """Close the pooled HTTP connections"""
+        self.session.close()
+
+    def __enter__(self) -> "OpenRouterAPI":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _system_message(model: str) -> Dict[str, Any]:
+        """Build the system message, marking the prompt cacheable where supported
+
+        Built once per model; the returned dict is shared and must not be modified.
+        """
+        if model.startswith("anthropic/"):
+            # Anthropic models need an explicit breakpoint to cache the prefix
+            content = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+        else:
+            content = SYSTEM_PROMPT
+        return {"role": "system", "content": content}
+
+    def _build_payload(self, user_content: str, model: str) -> Dict[str, Any]:
+        """Build a chat completion payload for a single user message"""
+        payload = {
+            "model": model,
+            "messages": [
+                self._system_message(model),
                 {
                     "role": "user",
-                    "content": prompt
+                    "content": user_content
                 }
             ],
-            "temperature": 0.7,
-            "max_tokens": 16000
+            "temperature": self.temperature,
+            "max_tokens": MAX_TOKENS
         }
+        self._fit_output_budget(payload)
+        return payload
+
+    @staticmethod
+    def _fit_output_budget(payload: Dict[str, Any]) -> None:
+        """Lower max_tokens so the prompt and output fit the model's context window
+
+        The prompt size is estimated at four characters per token. Raises
+        ValueError when the prompt alone does not fit, instead of sending a
+        request that can only fail or come back truncated.
+        """
+        context = MODEL_CONTEXT_TOKENS.get(payload["model"])
+        if context is None:
+            return
+        chars = len(SYSTEM_PROMPT)
+        for message in payload["messages"][1:]:
+            chars += len(message["content"])
+        prompt_tokens = chars // 4
+        budget = context - prompt_tokens - CONTEXT_MARGIN_TOKENS
+        if budget <= 0:
+            raise ValueError(f"Prompt of about {prompt_tokens} tokens does not fit the "
+                             f"{context}-token context of {payload['model']}")
+        if payload["max_tokens"] > budget:
+            logger.warning("Lowering max_tokens from %d to %d to fit the %s context window",
+                           payload["max_tokens"], budget, payload["model"])
+            payload["max_tokens"] = budget
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _encoded_system_message(model: str) -> bytes:
+        """JSON encoding of the system message, computed once per model"""
+        return _json_dumps(OpenRouterAPI._system_message(model))
+
+    def _encode_payload(self, payload: Dict[str, Any], **extra: Any) -> bytes:
+        """Serialize a payload with extra top-level fields
+
+        The multi-KB system message is spliced in from its cached encoding
+        instead of being re-encoded for every request.
+        """
+        messages = payload["messages"]
+        system = self._system_message(payload["model"])
+        if not messages or messages[0] is not system:
+            return _json_dumps({**payload, **extra})
+
+        rest = {key: value for key, value in payload.items() if key != "messages"}
+        rest.update(extra)
+        encoded = [self._encoded_system_message(payload["model"])]
+        encoded.extend(_json_dumps(message) for message in messages[1:])
+        return b'{"messages":[' + b",".join(encoded) + b"]," + _json_dumps(rest)[1:]
+
+    def _post_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a chat completion request and return the decoded response"""
+        body = self._encode_payload(payload, usage={"include": True})
+        # Rough prompt size - about four characters of JSON per token
+        self.limiter.acquire(len(body) // 4)
+        sent_at = time.monotonic()
+        # The session already sends Content-Type: application/json
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            data=body,
+            timeout=180
+        )
+        response.raise_for_status()
+        result = _json_loads(response.content)
+        if result.get("usage"):
+            self._log_usage(result["usage"], payload["model"], sent_at)
+        return result
+
+    def _stream_completion(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """POST a streaming chat completion request and yield content deltas as they arrive"""
+        body = self._encode_payload(payload, stream=True, usage={"include": True})
+        self.limiter.acquire(len(body) // 4)
+        sent_at = time.monotonic()
+        with self.session.post(
+            f"{self.base_url}/chat/completions",
+            data=body,
+            timeout=180,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                # Skip keep-alive blank lines and ": comment" frames
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[6:]
+                if data == b"[DONE]":
+                    break
+                chunk = _json_loads(data)
+                if "error" in chunk:
+                    raise RuntimeError(f"Streamed response failed: {chunk['error']}")
+                # Usage arrives in a final chunk that may carry no choices
+                if chunk.get("usage"):
+                    self._log_usage(chunk["usage"], payload["model"], sent_at)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def _log_usage(self, usage: Dict[str, Any], model: str, sent_at: float) -> None:
+        """Log token usage, including how much of the prompt was served from the provider cache
+
+        sent_at is the time.monotonic() at which the request was sent.
+        """
+        cached = usage.get("cache_read_input_tokens")
+        if cached is None:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        logger.info("Tokens: %s prompt (%s from cache), %s completion",
+                    usage.get("prompt_tokens"), cached, usage.get("completion_tokens"))
+
+        # Once the provider has cached a model's system prompt, requests sent
+        # after that should read it back; a miss means the prefix changed or
+        # the cache expired. Requests already in flight when the first write
+        # completed are expected to write it too
+        cached_at = self._prefix_cached_at.get(model)
+        after_write = cached_at is not None and sent_at >= cached_at
+        if cached or usage.get("cache_creation_input_tokens"):
+            if not cached and after_write:
+                logger.warning("Prompt prefix was written to the cache again instead of read - "
+                               "the system prompt may have changed between requests")
+            self._prefix_cached_at.setdefault(model, time.monotonic())
+        elif after_write:
+            logger.warning("No prompt tokens were served from the cache - the prefix may have drifted")
+
+    @staticmethod
+    def _extract_code(content: str) -> str:
+        """Clean up a model response to extract only the Python code"""
+        # Same parser as the streamed path, so both return the same code
+        extractor = _FenceExtractor()
+        extractor.feed(content)
+        return extractor.code()
+
+    def generate_scenario_code(self, prompt: str, model: str = DEFAULT_MODEL,
+                               use_cache: bool = True) -> str:
+        """Generate scenario code using OpenRouter API"""
+        
+        payload = self._build_payload(prompt, model)
+
+        use_cache = use_cache and self.temperature == 0
+        if use_cache:
+            cache_key = LLMCache.make_key(payload)
+            cached_code = self.cache.get(cache_key)
+            if cached_code is not None:
+                logger.info("Using cached scenario code")
+                return cached_code
 
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=180
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            generated_code = result["choices"][0]["message"]["content"]
-            
-            # Clean up the response to extract only Python code
-            if "```python" in generated_code:
-                start = generated_code.find("```python") + 9
-                end = generated_code.find("```", start)
-                generated_code = generated_code[start:end].strip()
-            elif "```" in generated_code:
-                start = generated_code.find("```") + 3
-                end = generated_code.find("```", start)
-                generated_code = generated_code[start:end].strip()
+            # Streamed so the response is decoded and the code block delimited
+            # while the model is still generating
+            generated_code = self._stream_code(payload)
+            if generated_code is None:
+                # A fresh sample usually avoids the call; the second one is kept
+                # either way and left to validation
+                logger.warning("Response loads a template with from_file() - retrying once")
+                generated_code = self._stream_code(payload, abort_on_banned=False)
+
+            if use_cache:
+                self.cache.set(cache_key, generated_code)
             
             return generated_code
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"API request failed: {e}")
+            logger.error("API request failed: %s", e)
             raise
         except KeyError as e:
-            logger.error(f"Unexpected API response format: {e}")
+            logger.error("Unexpected API response format: %s", e)
             raise
         except Exception as e:
-            logger.error(f"Unexpected error: {e}")
+            logger.error("Unexpected error: %s", e)
             raise
 
-class ScenarioGenerator:
-    """Main class for generating AoE2 scenarios using AI"""
-    
-    def __init__(self, api_key: str):
-        self.api = OpenRouterAPI(api_key)
-        self.scenario_templates = self._load_templates()
-    
-    def _load_templates(self) -> Dict[str, str]:
-        """Load scenario generation templates based on real AoE2 campaign patterns"""
-        return {
-            "battle": """Create an Age of Empires 2 BATTLE scenario based on Saladin Campaign (cam3) patterns:
+    def _stream_code(self, payload: Dict[str, Any], abort_on_banned: bool = True) -> Optional[str]:
+        """Stream a completion and return its code block
+
+        The stream is closed as soon as the closing fence arrives. Returns None
+        as soon as the code block calls AoE2DEScenario.from_file().
+        """
+        extractor = _FenceExtractor()
+        chunks = self._stream_completion(payload)
+        try:
+            for delta in chunks:
+                # Rescan a few characters so a call split across deltas is still found
+                scan_from = len(extractor.text) - len(BANNED_CALL)
+                extractor.feed(delta)
+                if abort_on_banned and extractor.start is not None:
+                    if extractor.text.find(BANNED_CALL, max(scan_from, extractor.start),
+                                           extractor.end) >= 0:
+                        return None
+                # Anything after the closing fence is commentary; closing the
+                # connection stops the generation instead of paying for it
+                if extractor.closed:
+                    break
+        finally:
+            chunks.close()
+        return extractor.code()
+
+    def generate_scenario_codes(self, prompts: List[str], model: str = DEFAULT_MODEL) -> List[str]:
+        """Generate code for several prompts with as few requests as possible
+
+        Identical prompts are sent once with "n" set to the number of copies.
+        Distinct prompts are packed, BATCH_MAX_SCENARIOS at a time, into
+        concurrent requests that each return a JSON object
+        {"scenarios": [{"id": i, "code": "..."}]}. A group whose response comes
+        back truncated or cannot be split into one result per prompt is halved
+        and retried; a single prompt is sent on its own.
+        """
+        try:
+            if len(prompts) > 1 and len(set(prompts)) == 1:
+                codes = self.generate_scenario_candidates(prompts[0], model, len(prompts))
+                if len(codes) < len(prompts):
+                    logger.info("Provider returned %d of %d choices - requesting the rest one at a time",
+                                len(codes), len(prompts))
+                    codes += [self.generate_scenario_code(prompts[0], model)
+                              for _ in range(len(prompts) - len(codes))]
+                return codes
+            groups = [prompts[i:i + BATCH_MAX_SCENARIOS] for i in range(0, len(prompts), BATCH_MAX_SCENARIOS)]
+            if len(groups) == 1:
+                return self._generate_batch(prompts, model)
+            with ThreadPoolExecutor(max_workers=min(len(groups), MAX_CONCURRENT_REQUESTS)) as pool:
+                results = pool.map(lambda group: self._generate_batch(group, model), groups)
+                return [code for codes in results for code in codes]
+        except requests.exceptions.RequestException as e:
+            logger.error("Batch API request failed: %s", e)
+            raise
+
+    def _generate_batch(self, prompts: List[str], model: str) -> List[str]:
+        """Send prompts as one batched request, halving the group until each part succeeds"""
+        if len(prompts) == 1:
+            return [self.generate_scenario_code(prompts[0], model)]
+
+        codes = None
+        if len(prompts) <= BATCH_MAX_SCENARIOS:
+            payload = self._build_payload(self._batch_prompt(prompts), model)
+            payload["response_format"] = {"type": "json_object"}
+            # Output budget grows with the number of scenarios packed in
+            payload["max_tokens"] = len(prompts) * BATCH_TOKENS_PER_SCENARIO
+            self._fit_output_budget(payload)
+            codes = self._split_batch(self._post_completion(payload), len(prompts))
+
+        if codes is None:
+            half = len(prompts) // 2
+            logger.info("Splitting batch of %d scenarios into %d + %d", len(prompts), half, len(prompts) - half)
+            codes = self._generate_batch(prompts[:half], model) + self._generate_batch(prompts[half:], model)
+        return codes
+
+    @staticmethod
+    def _batch_prompt(prompts: List[str]) -> str:
+        """Combine several scenario prompts into a single user message"""
+        parts = [
+            f"Generate {len(prompts)} separate scenarios, one for each SCENARIO section below.\n"
+            'Return ONLY a JSON object of the form {"scenarios": [{"id": 1, "code": "..."}, ...]} '
+            f"with one entry per scenario, where id is the SCENARIO number (1 to {len(prompts)}) "
+            "and code is its complete Python code. Do not wrap the code inside the strings "
+            "in markdown fences."
+        ]
+        for i, prompt in enumerate(prompts, 1):
+            parts.append(f"### SCENARIO {i}\n{prompt}")
+        return "\n\n".join(parts)
+
+    def generate_scenario_candidates(self, prompt: str, model: str = DEFAULT_MODEL,
+                                     count: int = 2) -> List[str]:
+        """Request count completions of one prompt in a single call with "n" set
+
+        Some providers ignore "n" and return a single choice, so fewer than
+        count codes may come back.
+        """
+        payload = self._build_payload(prompt, model)
+        payload["n"] = count
+        choices = sorted(self._post_completion(payload)["choices"], key=lambda choice: choice.get("index", 0))
+        return [self._extract_code(choice["message"]["content"]) for choice in choices[:count]]
+
+    def _split_batch(self, result: Dict[str, Any], count: int) -> Optional[List[str]]:
+        """Parse the JSON object of a batched response into code strings, ordered by id"""
+        choice = result["choices"][0]
+        if choice.get("finish_reason") == "length":
+            logger.warning("Batched response was truncated")
+            return None
+        content = choice["message"]["content"]
+        try:
+            # Tolerate a fence or stray text around the object
+            scenarios = _json_loads(content[content.find("{"):content.rfind("}") + 1])["scenarios"]
+            by_id = {int(entry["id"]): entry["code"] for entry in scenarios}
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Could not parse batched response as a scenarios object")
+            return None
+        if sorted(by_id) != list(range(1, count + 1)) or not all(isinstance(c, str) for c in by_id.values()):
+            logger.warning("Batched response does not contain one code string per scenario")
+            return None
+        return [self._extract_code(by_id[i]) for i in range(1, count + 1)]
+
+    def stream_scenario_code(self, prompt: str, model: str = DEFAULT_MODEL) -> Iterator[str]:
+        """Yield the raw response text for a scenario prompt as it is generated"""
+        return self._stream_completion(self._build_payload(prompt, model))
+
+    async def astream_scenario_code(self, prompt: str,
+                                    model: str = DEFAULT_MODEL) -> AsyncIterator[str]:
+        """Async generator over the raw response text for a scenario prompt"""
+        chunks = self.stream_scenario_code(prompt, model)
+        try:
+            while True:
+                # Deltas are never empty, so None marks the end of the stream
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            chunks.close()
+
+    async def generate_scenario_code_async(self, prompt: str, model: str = DEFAULT_MODEL,
+                                           use_cache: bool = True) -> str:
+        """Async variant of generate_scenario_code - the blocking request runs on a worker thread"""
+        return await asyncio.to_thread(self.generate_scenario_code, prompt, model, use_cache)
+
+# AoE2ScenarioParser modules used by generated scripts - only loaded once a script
+# is executed by a script runner, so importing this module stays cheap
+SCENARIO_PARSER_MODULES = (
+    "AoE2ScenarioParser.scenarios.aoe2_de_scenario",
+    "AoE2ScenarioParser.datasets.players",
+    "AoE2ScenarioParser.datasets.units",
+    "AoE2ScenarioParser.datasets.trigger_lists",
+    "AoE2ScenarioParser.datasets.buildings",
+    "AoE2ScenarioParser.datasets.other",
+    "AoE2ScenarioParser.datasets.techs",
+    "AoE2ScenarioParser.datasets.heroes",
+)
+
+# Directory holding scenario_helpers.py, which generated scripts import
+HELPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@functools.cache
+def _preload_scenario_parser() -> None:
+    """Import AoE2ScenarioParser once so later executions find it in sys.modules"""
+    if HELPERS_DIR not in sys.path:
+        sys.path.append(HELPERS_DIR)
+    for module_name in SCENARIO_PARSER_MODULES:
+        importlib.import_module(module_name)
+
+def _config_digest(config: "ScenarioConfig", model: str = DEFAULT_MODEL, temperature: float = 0.7) -> str:
+    """SHA-256 of everything that shapes a generated scenario - the config fields, model and temperature"""
+    fields = asdict(config)
+    # Only controls the response cache, not what gets generated
+    fields.pop("no_cache")
+    return hashlib.sha256(repr((sorted(fields.items()), model, temperature)).encode("utf-8")).hexdigest()
+
+@functools.lru_cache(maxsize=64)
+def _parse_scenario_code(code: str) -> ast.Module:
+    """Parse generated code once - the tree is shared by validation and compilation"""
+    return ast.parse(code, filename=_scenario_filename(code))
+
+def _scenario_filename(code: str) -> str:
+    """Pseudo filename for tracebacks, distinct per generated script"""
+    return f"<gen:{hashlib.sha256(code.encode('utf-8')).hexdigest()[:8]}>"
+
+@functools.lru_cache(maxsize=512)
+def _check_scenario_code(code: str) -> Tuple[Optional[str], int]:
+    """Check the structure of generated code
+
+    Returns the first problem found (None if the code looks complete) and the
+    number of add_trigger calls. Pure, so results are memoized per code string.
+    """
+    # Parse once and look names up in sets instead of rescanning the source
+    try:
+        tree = _parse_scenario_code(code)
+    except SyntaxError as e:
+        return f"Generated code does not parse: {e}", 0
+
+    names = set()
+    attrs = set()
+    creates_scenario = False
+    trigger_count = 0
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            # Counted in the same walk rather than with another pass over the text
+            if isinstance(node.func, ast.Attribute) and node.func.attr == "add_trigger":
+                trigger_count += 1
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update(alias.name.rsplit(".", 1)[-1] for alias in node.names)
+        elif isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            attrs.add(node.attr)
+            if (node.attr in ("from_default", "from_file")
+                    and isinstance(node.value, ast.Name)
+                    and node.value.id == "AoE2DEScenario"):
+                if node.attr == "from_file":
+                    return "Loads a template file with from_file()", 0
+                creates_scenario = True
+
+    # Check for required imports
+    for import_name in REQUIRED_IMPORTS:
+        if import_name not in names:
+            return f"Missing required import: {import_name}", 0
+
+    # Check for basic structure
+    if not creates_scenario:
+        return "Missing scenario object creation", 0
+
+    if "write_to_file" not in attrs:
+        return "Missing scenario save operation", 0
+
+    return None, trigger_count
+
+@functools.lru_cache(maxsize=64)
+def _compile_scenario_code(code: str):
+    """Compile generated scenario code, reusing the code object for repeated runs
+
+    Compiles from the cached tree, so code that was already validated is not parsed again.
+    """
+    return compile(_parse_scenario_code(code), _scenario_filename(code), "exec")
+
+class _CaptureBuffer(io.BytesIO):
+    """Byte buffer for captured script output that stays readable after close()
+
+    Scripts that rewrap sys.stdout.buffer or sys.stderr.buffer close it
+    when their wrapper is garbage collected.
+    """
+
+    def close(self) -> None:
+        pass
+
+def _exec_scenario_code(code: str, script_path: str) -> Optional[str]:
+    """Run generated code in this interpreter as if it were the script at script_path
+
+    Returns None on success, otherwise the error and whatever the script wrote to stderr.
+    """
+    code_obj = _compile_scenario_code(code)
+    # The globals a script run from a file gets, so paths built from __file__ still work
+    exec_globals = {"__name__": "__main__", "__file__": script_path, "__builtins__": builtins}
+
+    # Byte-backed buffers, since older generated scripts rewrap sys.stdout.buffer
+    stdout = io.TextIOWrapper(_CaptureBuffer(), encoding="utf-8", errors="replace")
+    stderr = io.TextIOWrapper(_CaptureBuffer(), encoding="utf-8", errors="replace")
+    error = None
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(code_obj, exec_globals)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f"exited with {e.code}"
+    except Exception:
+        error = traceback.format_exc()
+    if error is None:
+        return None
+    stderr.flush()
+    output = stderr.buffer.getvalue().decode("utf-8", errors="replace")
+    return "\n".join(part.strip() for part in (output, error) if part.strip())
+
+def _script_runner_main() -> None:
+    """Entry point of a _ScriptRunner interpreter - imports the parser once, then runs scripts as they arrive
+
+    Reads one JSON-encoded [code, script_path] pair per line from stdin and
+    answers each with a JSON line: null on success, otherwise a description
+    of the failure.
+    """
+    # Replies go to the original stdout; anything a script writes to file
+    # descriptor 1 directly ends up on stderr instead of in the replies
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    # The interpreter inherits the environment, but generated code never
+    # calls the API, so it does not get the key
+    os.environ.pop("OPENROUTER_API_KEY", None)
+    _preload_scenario_parser()
+    replies.write("null\n")
+    replies.flush()
+    for line in sys.stdin:
+        # A failing script must never take the runner down with it
+        try:
+            reply = _exec_scenario_code(*json.loads(line))
+        except BaseException:
+            reply = traceback.format_exc()
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+# Module the runner interpreter imports to find _script_runner_main - never
+# the caller's __main__, whose top-level code would run again
+_RUNNER_MODULE = Path(__file__).stem if __name__ == "__main__" else __name__
+
+# Put on a runner's reply queue when its interpreter has exited
+_RUNNER_EXITED = object()
+
+def _read_replies(stream, replies: "queue.Queue") -> None:
+    """Move a runner's JSON reply lines onto a queue, ending with _RUNNER_EXITED"""
+    with stream:
+        for line in stream:
+            replies.put(json.loads(line))
+    replies.put(_RUNNER_EXITED)
+
+class _ScriptRunner:
+    """A child interpreter that keeps AoE2ScenarioParser imported between scripts
+
+    Scripts run one at a time. A script that overruns its timeout is stopped
+    by killing the interpreter; the next script starts a fresh one.
+    """
+
+    def __init__(self):
+        self._process = None
+        self._replies = None
+
+    def _start(self) -> None:
+        command = (f"import sys; sys.path.insert(0, {HELPERS_DIR!r}); "
+                   f"from {_RUNNER_MODULE} import _script_runner_main; _script_runner_main()")
+        self._process = subprocess.Popen([sys.executable, "-c", command], stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, encoding="utf-8")
+        # Replies are read on a thread so waiting for one can time out on every platform
+        self._replies = queue.Queue()
+        threading.Thread(target=_read_replies, args=(self._process.stdout, self._replies),
+                         daemon=True).start()
+        # Wait for the imports, so they do not count against the first script's timeout
+        if self._replies.get() is _RUNNER_EXITED:
+            exitcode = self._exit_code()
+            self.close()
+            raise RuntimeError(f"Script runner failed to start (exit code {exitcode})")
+
+    def run(self, code: str, script_path: str, timeout: float) -> Optional[str]:
+        """Run generated code as script_path, returning None on success or a description of the failure"""
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+        try:
+            self._process.stdin.write(json.dumps([code, script_path]) + "\n")
+            self._process.stdin.flush()
+            reply = self._replies.get(timeout=timeout)
+        except OSError:
+            reply = _RUNNER_EXITED
+        except queue.Empty:
+            self.close()
+            return f"timed out after {timeout}s"
+        if reply is _RUNNER_EXITED:
+            exitcode = self._exit_code()
+            self.close()
+            return f"interpreter exited with code {exitcode}"
+        return reply
+
+    def _exit_code(self) -> Optional[int]:
+        """Exit code of the interpreter, after giving it a moment to finish exiting"""
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            self._process.wait(timeout=5)
+        return self._process.returncode
+
+    def close(self) -> None:
+        """Stop the interpreter"""
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            # stdout is closed by the reply thread once it reaches the end
+            with contextlib.suppress(OSError):
+                self._process.stdin.close()
+            self._process = None
+            self._replies = None
+
+# Scenario generation templates based on real AoE2 campaign patterns.
+# Built once at import and shared read-only by every ScenarioGenerator.
+_TEMPLATES: Mapping[str, str] = MappingProxyType({
+    "battle": """Create an Age of Empires 2 BATTLE scenario based on Saladin Campaign (cam3) patterns:
             - Title: {title}
             - Description: {description}
             - Map size: {map_size}x{map_size}
@@ -583,7 +1560,7 @@ class ScenarioGenerator:
             TOTAL: 25 triggers MINIMUM. If you have fewer, GO BACK AND ADD MORE.
             ==============================================================""",
 
-            "escort": """ESCORT SCENARIO - CREATE EXACTLY 17 TRIGGERS
+    "escort": """ESCORT SCENARIO - CREATE EXACTLY 17 TRIGGERS
 Title: {title} | Description: {description} | Map: {map_size}x{map_size} | Players: {players}
 
 === COORDINATES ===
@@ -810,7 +1787,7 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
 - Enemy gates owned by PlayerId.TWO
 - Spawn multiple units with loops, not quantity parameter""",
 
-            "diplomacy": """Create an Age of Empires 2 DIPLOMACY scenario based on Genghis Khan Campaign (cam4) patterns:
+    "diplomacy": """Create an Age of Empires 2 DIPLOMACY scenario based on Genghis Khan Campaign (cam4) patterns:
             - Title: {title}
             - Description: {description}
             - Map size: {map_size}x{map_size}
@@ -1039,7 +2016,7 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
             TOTAL: 50-65 triggers MINIMUM
             ===============================================""",
 
-            "defense": """Create an Age of Empires 2 DEFENSE scenario based on Saladin Campaign (cam3) siege patterns:
+    "defense": """Create an Age of Empires 2 DEFENSE scenario based on Saladin Campaign (cam3) siege patterns:
             - Title: {title}
             - Description: {description}
             - Map size: {map_size}x{map_size}
@@ -1273,7 +2250,7 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
             TOTAL: 45 triggers MINIMUM
             ===============================================""",
 
-            "conquest": """Create an Age of Empires 2 CONQUEST scenario based on Genghis Khan Campaign (cam4) patterns:
+    "conquest": """Create an Age of Empires 2 CONQUEST scenario based on Genghis Khan Campaign (cam4) patterns:
             - Title: {title}
             - Description: {description}
             - Map size: {map_size}x{map_size}
@@ -1567,7 +2544,7 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
             TOTAL: 47 triggers MINIMUM
             ===============================================""",
 
-            "story": """Create an Age of Empires 2 STORY scenario combining patterns from all campaigns:
+    "story": """Create an Age of Empires 2 STORY scenario combining patterns from all campaigns:
             - Title: {title}
             - Description: {description}
             - Map size: {map_size}x{map_size}
@@ -1883,22 +2860,78 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
             ---------------------------------------------------------
             TOTAL: 57 triggers MINIMUM
             ==============================================="""
-        }
-    
-    def generate_scenario(self, config: ScenarioConfig) -> str:
-        """Generate a scenario based on the provided configuration"""
+})
 
-        # Select appropriate template
-        template = self.scenario_templates.get(config.scenario_type, self.scenario_templates["story"])
+def _compile_template(template: str) -> List[Tuple[str, Optional[str], str]]:
+    """Split a str.format template into (literal, field, format_spec) segments"""
+    return [
+        (literal, field, format_spec)
+        for literal, field, format_spec, _ in string.Formatter().parse(template)
+    ]
 
-        # Format the prompt
-        prompt = template.format(
-            title=config.title,
-            description=config.description,
-            map_size=config.map_size,
-            players=config.players,
-            difficulty=config.difficulty
-        )
+# Templates are parsed once so prompts are assembled by concatenation
+_COMPILED_TEMPLATES: Mapping[str, List[Tuple[str, Optional[str], str]]] = MappingProxyType({
+    name: _compile_template(template) for name, template in _TEMPLATES.items()
+})
+
+@functools.lru_cache(maxsize=256)
+def _format_prompt(scenario_type: str, title: str, description: str,
+                   map_size: int, players: int, difficulty: str) -> str:
+    """Fill the compiled template for a scenario type - memoized for repeated configs"""
+    segments = _COMPILED_TEMPLATES.get(scenario_type, _COMPILED_TEMPLATES["story"])
+    fields = {"title": title, "description": description, "map_size": map_size,
+              "players": players, "difficulty": difficulty}
+    return "".join(
+        literal + (format(fields[field], format_spec) if field is not None else "")
+        for literal, field, format_spec in segments
+    )
+
+class ScenarioGenerator:
+    """Main class for generating AoE2 scenarios using AI"""
+    
+    def __init__(self, api_key: str, trusted_mode: bool = True, deterministic: bool = False,
+                 semantic_cache: Optional[ScenarioCache] = None, model_routing: bool = False,
+                 candidates: int = 1):
+        # Deterministic generation runs at temperature 0, which also enables the response cache
+        self.api = OpenRouterAPI(api_key, temperature=0 if deterministic else 0.7)
+        # Trusted code runs in reusable interpreters that keep the parser imported;
+        # otherwise each script gets a fresh interpreter of its own
+        self.trusted_mode = trusted_mode
+        # Idle script runners, reused by later trusted saves
+        self._runners: List[_ScriptRunner] = []
+        self._runners_lock = threading.Lock()
+        # Per near-duplicate cache structure key, serializes generations that may reuse each other
+        self._structure_locks: Dict[str, threading.Lock] = {}
+        # Model that produced the code for each output path, recorded in its digest
+        self._output_models: Dict[str, str] = {}
+        self.scenario_templates = _TEMPLATES
+        # Opt-in: near-duplicate configs reuse previously generated code
+        self.semantic_cache = semantic_cache
+        # Opt-in: easy/medium scenarios go to FAST_MODEL first
+        self.model_routing = model_routing
+        # Completions requested per scenario in one call; the first valid one is kept
+        self.candidates = max(1, candidates)
+
+    def close(self) -> None:
+        """Release the API client's HTTP connections and stop the script runners"""
+        self.api.close()
+        with self._runners_lock:
+            runners, self._runners = self._runners, []
+        for runner in runners:
+            runner.close()
+
+    def __enter__(self) -> "ScenarioGenerator":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def build_prompt(self, config: ScenarioConfig) -> str:
+        """Build the user prompt for a scenario configuration"""
+
+        # Select and format the appropriate template
+        prompt = _format_prompt(config.scenario_type, config.title, config.description,
+                                config.map_size, config.players, config.difficulty)
 
         # Add geographic region for terrain accuracy
         if config.region:
@@ -1934,12 +2967,126 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
             - Timeline of events
             - Dialogue reflecting the era"""
 
-        # Generate the scenario code
-        logger.info(f"Generating scenario: {config.title}")
-        generated_code = self.api.generate_scenario_code(prompt)
+        return prompt
+
+    def generate_scenario(self, config: ScenarioConfig) -> str:
+        """Generate a scenario based on the provided configuration"""
+        return self._generate_cached(self.build_prompt(config), config)
+
+    def _generate_cached(self, prompt: str, config: ScenarioConfig) -> str:
+        """Generate code for a config, answering from the near-duplicate cache when enabled
+
+        Configs the cache could match against each other (same structure key)
+        are generated one after another, so a near-duplicate in flight at the
+        same time reuses the first one's code instead of also missing.
+        """
+        if self.semantic_cache is None or config.no_cache:
+            logger.info("Generating scenario: %s", config.title)
+            return self._generate_code(prompt, config)
+
+        with self._structure_lock(config):
+            cached_code = self.semantic_cache.get(config)
+            if cached_code is not None:
+                return cached_code
+            logger.info("Generating scenario: %s", config.title)
+            generated_code = self._generate_code(prompt, config)
+            self.semantic_cache.set(config, generated_code)
+        return generated_code
 
+    def _structure_lock(self, config: ScenarioConfig) -> threading.Lock:
+        """Lock shared by all configs with the same near-duplicate cache structure key"""
+        # dict.setdefault is atomic, so concurrent callers always share one lock
+        return self._structure_locks.setdefault(ScenarioCache._structure_key(config), threading.Lock())
+
+    def _pick_model(self, config: ScenarioConfig) -> str:
+        """Model for the first attempt at a scenario"""
+        if self.model_routing and config.difficulty in FAST_MODEL_DIFFICULTIES:
+            return FAST_MODEL
+        return DEFAULT_MODEL
+
+    def _generate_code(self, prompt: str, config: ScenarioConfig) -> str:
+        """Request code for a prompt, escalating once to DEFAULT_MODEL if a routed attempt is invalid"""
+        use_cache = not config.no_cache
+        model = self._pick_model(config)
+        generated_code = self._request_code(prompt, model, use_cache)
+        if model != DEFAULT_MODEL:
+            problem, _ = _check_scenario_code(generated_code)
+            if problem is not None:
+                logger.info("Retrying %s with %s: %s", config.title, DEFAULT_MODEL, problem)
+                model = DEFAULT_MODEL
+                generated_code = self._request_code(prompt, model, use_cache)
+        self._output_models[config.output_path] = model
         return generated_code
 
+    def _request_code(self, prompt: str, model: str, use_cache: bool) -> str:
+        """One API call for a prompt, keeping the first of the candidates that passes validation"""
+        if self.candidates == 1:
+            return self.api.generate_scenario_code(prompt, model, use_cache)
+
+        # Sent once with "n" set, so the prompt is only billed once
+        codes = self.api.generate_scenario_candidates(prompt, model, self.candidates)
+        for code in codes:
+            if _check_scenario_code(code)[0] is None:
+                return code
+        # Providers that ignore "n" return one choice; the remaining candidates
+        # are sampled one at a time, stopping at the first valid one
+        for _ in range(self.candidates - len(codes)):
+            code = self.api.generate_scenario_code(prompt, model, use_cache=False)
+            if _check_scenario_code(code)[0] is None:
+                return code
+            codes.append(code)
+        logger.warning("None of the %d candidates passed validation", len(codes))
+        return codes[0]
+
+    def generate_scenarios_batch(self, configs: List[ScenarioConfig]) -> List[str]:
+        """Generate several scenarios with as few API requests as possible"""
+        prompts = [self.build_prompt(config) for config in configs]
+        logger.info("Generating %d scenarios as a batch", len(configs))
+        return self.api.generate_scenario_codes(prompts)
+
+    async def generate_scenario_async(self, config: ScenarioConfig) -> str:
+        """Async variant of generate_scenario"""
+        return await asyncio.to_thread(self._generate_cached, self.build_prompt(config), config)
+
+    async def generate_scenarios_async(self, configs: List[ScenarioConfig],
+                                       max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> List[Any]:
+        """Generate several scenarios concurrently
+
+        Results are returned in the same order as configs; a failed
+        generation leaves the raised exception in its slot. Configs that
+        build byte-identical prompts share a single request, and at most
+        max_concurrency requests are in flight at once.
+        """
+        groups: Dict[Tuple[str, bool], List[int]] = {}
+        prompts: Dict[Tuple[str, bool], str] = {}
+        for i, config in enumerate(configs):
+            prompt = self.build_prompt(config)
+            key = (hashlib.sha256(prompt.encode("utf-8")).hexdigest(), config.no_cache)
+            groups.setdefault(key, []).append(i)
+            prompts.setdefault(key, prompt)
+
+        if len(groups) < len(configs):
+            logger.info("Deduplicated %d scenarios to %d unique prompts", len(configs), len(groups))
+
+        slots = asyncio.Semaphore(max_concurrency)
+
+        async def _one(key: Tuple[str, bool]) -> str:
+            async with slots:
+                return await asyncio.to_thread(self._generate_cached, prompts[key], configs[groups[key][0]])
+
+        unique_results = await asyncio.gather(*(_one(key) for key in groups), return_exceptions=True)
+
+        results: List[Any] = [None] * len(configs)
+        for indices, result in zip(groups.values(), unique_results):
+            for i in indices:
+                results[i] = result
+        return results
+
+    def generate_scenarios(self, configs: List[ScenarioConfig],
+                           max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> List[Any]:
+        """Blocking wrapper around generate_scenarios_async"""
+        return asyncio.run(self.generate_scenarios_async(configs, max_concurrency))
+
     def _get_region_template(self, region: str) -> str:
         """Return terrain building instructions for a geographic region"""
         templates = {
@@ -2175,95 +3322,171 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
             result += f"\nENEMY BUILDING STYLE:\n{civ_styles[enemy_civ]}"
         return result if result else "# Use default building styles"
     
+    def is_up_to_date(self, config: ScenarioConfig) -> bool:
+        """True if config.output_path exists and was generated from an identical config"""
+        if config.no_cache:
+            return False
+        try:
+            stored = Path(config.output_path + ".hash").read_text(errors="ignore").strip()
+        except OSError:
+            return False
+        # A routed scenario may have been escalated to DEFAULT_MODEL last time
+        digests = {_config_digest(config, model, self.api.temperature)
+                   for model in (self._pick_model(config), DEFAULT_MODEL)}
+        return stored in digests and Path(config.output_path).exists()
+
+    def mark_generated(self, config: ScenarioConfig) -> None:
+        """Record the config digest next to its output so unchanged configs are skipped next run"""
+        model = self._output_models.get(config.output_path, self._pick_model(config))
+        Path(config.output_path + ".hash").write_text(_config_digest(config, model, self.api.temperature))
+
     def save_scenario(self, code: str, output_path: str) -> bool:
-        """Save the generated scenario code to a file and execute it"""
+        """Execute the generated scenario code to produce the scenario file"""
         try:
             # Create output directory if it doesn't exist
             output_dir = Path(output_path).parent
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # Write the generated code to a temporary file
-            temp_file = "temp_scenario_generator.py"
-            with open(temp_file, "w", encoding="utf-8") as f:
-                f.write(code)
-            
+            # The model picks its own file name; the script saves to output_path instead
+            code = self._target_output(code, output_path)
+
             # Execute the generated code
-            logger.info(f"Executing generated scenario code...")
-            
-            # Import and execute the generated code
-            import subprocess
-            import sys
-            
-            result = subprocess.run([sys.executable, temp_file], 
-                                  capture_output=True, text=True, timeout=60)
-            
-            if result.returncode != 0:
-                logger.error(f"Scenario execution failed: {result.stderr}")
+            logger.info("Executing generated scenario code...")
+
+            if self.trusted_mode:
+                success = self._execute_in_runner(code, output_dir)
+            else:
+                success = self._execute_in_subprocess(code, output_dir)
+            if not success:
                 return False
             
-            logger.info(f"Scenario generated successfully: {output_path}")
-            
-            # Clean up temporary file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            
+            logger.info("Scenario generated successfully: %s", output_path)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to save/execute scenario: {e}")
+            logger.error("Failed to save/execute scenario: %s", e)
             return False
+
+    @staticmethod
+    def _target_output(code: str, output_path: str) -> str:
+        """Point the script's write_to_file() calls at output_path"""
+        try:
+            rewritten = _replace_string_constants(code, {}, output_path)
+        except SyntaxError:
+            # Left for execution to report
+            return code
+        if rewritten is None:
+            logger.warning("write_to_file() path is not a plain string - the script keeps its own output path")
+            return code
+        return rewritten
+
+    def save_scenarios(self, jobs: List[Tuple[str, str]]) -> List[bool]:
+        """Execute several generated scenarios in parallel
+
+        jobs holds (code, output_path) pairs; results come back in the same
+        order. In trusted mode each worker thread drives its own script
+        runner, so the parser's CPU-bound file writes overlap across cores.
+        """
+        if not self.trusted_mode or len(jobs) < 2:
+            return [self.save_scenario(code, output_path) for code, output_path in jobs]
+
+        workers = min(len(jobs), os.cpu_count() or 1)
+        logger.info("Executing %d generated scenarios on %d processes...", len(jobs), workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda job: self.save_scenario(*job), jobs))
+
+    def _execute_in_runner(self, code: str, output_dir: Path) -> bool:
+        """Run generated code in an idle script runner, starting one if none is free"""
+        with self._runners_lock:
+            runner = self._runners.pop() if self._runners else _ScriptRunner()
+        try:
+            # Runs as if saved next to its output, like the subprocess path's temporary script
+            error = runner.run(code, str(output_dir.resolve() / "generated_scenario.py"), EXECUTION_TIMEOUT)
+        finally:
+            with self._runners_lock:
+                self._runners.append(runner)
+        if error is not None:
+            logger.error("Scenario execution failed: %s", error)
+            return False
+        return True
+
+    def _execute_in_subprocess(self, code: str, output_dir: Path) -> bool:
+        """Run generated code in a separate interpreter"""
+        # Write the generated code to a uniquely named temporary file, so
+        # concurrent saves never overwrite each other's script
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False, dir=output_dir,
+                                         encoding="utf-8") as f:
+            f.write(code)
+        temp_file = f.name
+
+        try:
+            # Generated scripts import scenario_helpers, which lives next to this module
+            env = dict(os.environ)
+            # Generated code never calls the API, so it does not get the key
+            env.pop("OPENROUTER_API_KEY", None)
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, (HELPERS_DIR, env.get("PYTHONPATH"))))
+            # Scenario text is often non-ASCII; the interpreter sets up UTF-8
+            # stdio itself instead of every script rewrapping sys.stdout
+            env["PYTHONIOENCODING"] = "utf-8:replace"
+            result = subprocess.run([sys.executable, temp_file], env=env, capture_output=True,
+                                    encoding="utf-8", errors="replace", timeout=EXECUTION_TIMEOUT)
+        finally:
+            # The script may have cleaned up its own directory
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temp_file)
+
+        if result.returncode != 0:
+            logger.error("Scenario execution failed: %s", result.stderr)
+            return False
+
+        return True
     
     def validate_scenario_code(self, code: str, min_triggers: int = 20) -> bool:
         """Validate the generated scenario code for basic syntax and structure"""
         try:
-            # Check for required imports
-            required_imports = [
-                "AoE2DEScenario",
-                "PlayerId",
-                "UnitInfo",
-                "BuildingInfo"
-            ]
-
-            for import_name in required_imports:
-                if import_name not in code:
-                    logger.warning(f"Missing required import: {import_name}")
-                    return False
-
-            # Check for basic structure
-            if "AoE2DEScenario.from_default()" not in code and "AoE2DEScenario.from_file(" not in code:
-                logger.warning("Missing scenario object creation")
-                return False
-
-            if "write_to_file" not in code:
-                logger.warning("Missing scenario save operation")
+            # Repeated (e.g. cached) code strings skip the parse entirely
+            problem, trigger_count = _check_scenario_code(code)
+            if problem is not None:
+                logger.warning(problem)
                 return False
 
             # Check for minimum trigger count
-            trigger_count = code.count("add_trigger(")
             if trigger_count < min_triggers:
-                logger.warning(f"Insufficient triggers: found {trigger_count}, expected at least {min_triggers}")
+                logger.warning("Insufficient triggers: found %d, expected at least %d", trigger_count, min_triggers)
                 logger.warning("Generated scenario may be incomplete - consider regenerating")
                 # Return True but with warning - don't block execution, just warn
             else:
-                logger.info(f"Trigger count validated: {trigger_count} triggers found")
+                logger.info("Trigger count validated: %d triggers found", trigger_count)
 
             return True
 
         except Exception as e:
-            logger.error(f"Code validation failed: {e}")
+            logger.error("Code validation failed: %s", e)
             return False
 
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Command line options for the example run in main()"""
+    parser = argparse.ArgumentParser(description="Generate the example AoE2 scenarios")
+    parser.add_argument("--batch", action="store_true",
+                        help="pack the scenarios into as few API requests as possible")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerate every scenario, ignoring cached responses and existing outputs")
+    return parser.parse_args(argv)
+
 def main():
     """Main function to demonstrate the scenario generator"""
+    args = _parse_args()
     
     # Get API key from environment variable
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
-        print("Please set the OPENROUTER_API_KEY environment variable")
+        logger.error("Please set the OPENROUTER_API_KEY environment variable")
+        return
+
+    # Generated scripts need AoE2ScenarioParser - fail before spending any API calls
+    if importlib.util.find_spec("AoE2ScenarioParser") is None:
+        logger.error("AoE2ScenarioParser is not installed - run: pip install AoE2ScenarioParser")
         return
-    
-    # Initialize the generator
-    generator = ScenarioGenerator(api_key)
     
     # Example scenario configurations showcasing all scenario types
     scenarios = [
@@ -2329,26 +3552,94 @@ def main():
         )
     ]
     
-    # Generate scenarios
-    for config in scenarios:
+    if args.no_cache:
+        scenarios = [replace(config, no_cache=True) for config in scenarios]
+
+    # Initialize the generator - leaving the block closes its HTTP connections
+    with ScenarioGenerator(api_key) as generator:
+        _run_examples(generator, scenarios, args.batch)
+
+def _run_examples(generator: ScenarioGenerator, scenarios: List[ScenarioConfig], batch: bool) -> None:
+    """Generate and save the example scenarios that are not already up to date"""
+    # Repeated configs (same fields and output path) are generated once
+    unique = list({_config_digest(config): config for config in scenarios}.values())
+    if len(unique) < len(scenarios):
+        logger.info("Skipping %d duplicate scenario configs", len(scenarios) - len(unique))
+
+    # Skip scenarios whose output was already generated from the same config
+    pending = []
+    for config in unique:
+        if generator.is_up_to_date(config):
+            logger.info("Skipping %s (unchanged)", config.title)
+        else:
+            pending.append(config)
+    scenarios = pending
+
+    logger.info("Generating %d scenarios...", len(scenarios))
+    if batch and scenarios:
+        # One request carries several scenarios; the codes are then saved in order
         try:
-            print(f"\nGenerating scenario: {config.title}")
-            
-            # Generate the scenario code
-            generated_code = generator.generate_scenario(config)
-            
-            # Validate the code
-            if not generator.validate_scenario_code(generated_code):
-                print(f"Warning: Generated code may have issues for {config.title}")
-            
-            # Save and execute the scenario
-            if generator.save_scenario(generated_code, config.output_path):
-                print(f"Successfully generated: {config.output_path}")
-            else:
-                print(f"Failed to generate: {config.title}")
-                
+            codes = generator.generate_scenarios_batch(scenarios)
+        except Exception as e:
+            logger.error("Error generating scenarios: %s", e)
+            return
+        for config, generated_code in zip(scenarios, codes):
+            _validate(generator, config, generated_code)
+        # The scripts write distinct files, so they execute in parallel
+        results = generator.save_scenarios([(code, config.output_path)
+                                            for config, code in zip(scenarios, codes)])
+        for config, success in zip(scenarios, results):
+            _record_save(generator, config, success)
+    else:
+        # Generate all scenarios concurrently - each call is network-bound
+        asyncio.run(_generate_and_save(generator, scenarios))
+
+def _validate(generator: ScenarioGenerator, config: ScenarioConfig, generated_code: str) -> None:
+    """Log a warning if generated code fails validation - it is still executed"""
+    if not generator.validate_scenario_code(generated_code):
+        logger.warning("Generated code may have issues for %s", config.title)
+
+def _record_save(generator: ScenarioGenerator, config: ScenarioConfig, success: bool) -> None:
+    """Log the outcome of a save and mark successful outputs as generated"""
+    if success and Path(config.output_path).exists():
+        generator.mark_generated(config)
+        logger.info("Successfully generated: %s", config.output_path)
+    elif success:
+        logger.error("Script for %s ran but did not write %s", config.title, config.output_path)
+    else:
+        logger.error("Failed to generate: %s", config.title)
+
+def _validate_and_save(generator: ScenarioGenerator, config: ScenarioConfig, generated_code: str) -> None:
+    """Validate one generated scenario, execute it and record it as generated"""
+    try:
+        _validate(generator, config, generated_code)
+        # Save and execute the scenario
+        _record_save(generator, config, generator.save_scenario(generated_code, config.output_path))
+    except Exception as e:
+        logger.error("Error generating %s: %s", config.title, e)
+
+async def _generate_and_save(generator: ScenarioGenerator, configs: List[ScenarioConfig],
+                             max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> None:
+    """Generate, validate and save each scenario, starting each save as soon as its code arrives
+
+    Every script runs in an interpreter of its own, so up to one save per
+    core executes at a time and the parser's CPU-bound file writes overlap.
+    """
+    requests_slots = asyncio.Semaphore(max_concurrency)
+    save_slots = asyncio.Semaphore(os.cpu_count() or 1)
+
+    async def _one(config: ScenarioConfig) -> None:
+        try:
+            async with requests_slots:
+                generated_code = await generator.generate_scenario_async(config)
         except Exception as e:
-            print(f"Error generating {config.title}: {e}")
+            logger.error("Error generating %s: %s", config.title, e)
+            return
+
+        async with save_slots:
+            await asyncio.to_thread(_validate_and_save, generator, config, generated_code)
+
+    await asyncio.gather(*(_one(config) for config in configs))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,6 +1,11 @@
 import os
 import json
+import tempfile
+import contextlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 import logging
@@ -72,6 +77,17 @@ class OpenRouterAPI:
             "HTTP-Referer": "https://aoe2scenario-generator.com",
             "X-Title": "AoE2 Scenario Generator"
         }
+        # One session for all calls so the TCP/TLS connection is reused
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Retry transient failures and 429/5xx responses - POST is not retried by default
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=1.5, status_forcelist=[429, 500, 502, 503, 504],
+                              allowed_methods=["POST"])
+        )
+        self.session.mount("https://", adapter)
     
     def generate_scenario_code(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet") -> str:
         """Generate scenario code using OpenRouter API"""
@@ -376,9 +392,8 @@ class OpenRouterAPI:
         }
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
-                headers=self.headers,
                 json=payload,
                 timeout=180
             )
@@ -2204,20 +2219,26 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
                 code
             )
 
-            # Write the generated code to a temporary file
-            temp_file = "temp_scenario_generator.py"
-            with open(temp_file, "w", encoding="utf-8") as f:
-                f.write(code)
+            # Write the generated code to a temporary file - uniquely named,
+            # since several scenarios may be saved at the same time
+            fd, temp_file = tempfile.mkstemp(prefix="temp_scenario_generator_", suffix=".py", dir=".")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(code)
 
-            # Execute the generated code
-            logger.info(f"Executing generated scenario code...")
+                # Execute the generated code
+                logger.info(f"Executing generated scenario code...")
 
-            # Import and execute the generated code
-            import subprocess
-            import sys
+                # Import and execute the generated code
+                import subprocess
+                import sys
 
-            result = subprocess.run([sys.executable, temp_file],
-                                  capture_output=True, text=True, timeout=60)
+                result = subprocess.run([sys.executable, temp_file],
+                                      capture_output=True, text=True, timeout=60)
+            finally:
+                # Clean up temporary file, also after a failure or timeout
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(temp_file)
 
             if result.returncode != 0:
                 logger.error(f"Scenario execution failed: {result.stderr}")
@@ -2225,10 +2246,6 @@ scenario.write_to_file("OUTPUT_SCENARIO.aoe2scenario")  # Replace with actual ou
 
             logger.info(f"Scenario generated successfully: {output_path}")
 
-            # Clean up temporary file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-
             return True
             
         except Exception as e:
@@ -2351,26 +2368,31 @@ def main():
         )
     ]
     
-    # Generate scenarios
-    for config in scenarios:
-        try:
-            print(f"\nGenerating scenario: {config.title}")
-            
-            # Generate the scenario code
-            generated_code = generator.generate_scenario(config)
-            
-            # Validate the code
-            if not generator.validate_scenario_code(generated_code):
-                print(f"Warning: Generated code may have issues for {config.title}")
+    # Generate scenarios - each one is network-bound, so they run on threads
+    print(f"\nGenerating {len(scenarios)} scenarios...")
+    with ThreadPoolExecutor(max_workers=6) as ex:
+        futures = [ex.submit(_run_one, generator, config) for config in scenarios]
+        for future in as_completed(futures):
+            config, ok, msg = future.result()
+            print(msg)
+
+def _run_one(generator: ScenarioGenerator, config: ScenarioConfig):
+    """Generate, validate and save one scenario; returns (config, ok, message)"""
+    try:
+        # Generate the scenario code
+        generated_code = generator.generate_scenario(config)
+        
+        # Validate the code
+        if not generator.validate_scenario_code(generated_code):
+            print(f"Warning: Generated code may have issues for {config.title}")
+        
+        # Save and execute the scenario
+        if generator.save_scenario(generated_code, config.output_path):
+            return config, True, f"Successfully generated: {config.output_path}"
+        return config, False, f"Failed to generate: {config.title}"
             
-            # Save and execute the scenario
-            if generator.save_scenario(generated_code, config.output_path):
-                print(f"Successfully generated: {config.output_path}")
-            else:
-                print(f"Failed to generate: {config.title}")
-                
-        except Exception as e:
-            print(f"Error generating {config.title}: {e}")
+    except Exception as e:
+        return config, False, f"Error generating {config.title}: {e}"
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
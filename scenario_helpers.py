@@ -0,0 +1,45 @@
+"""
+Coordinate helpers imported by generated scenario scripts
+Builds placement coordinates in one call instead of nested loops in every script
+"""
+import random
+from typing import List, Optional, Tuple
+
+Coord = Tuple[int, int]
+
+
+def grid_coords(x1: int, y1: int, x2: int, y2: int, step: int = 1) -> List[Coord]:
+    """Every step-th tile in the rectangle x1..x2, y1..y2 (inclusive), row by row"""
+    xs = range(x1, x2 + 1, step)
+    return [(x, y) for y in range(y1, y2 + 1, step) for x in xs]
+
+
+def scatter(x1: int, y1: int, x2: int, y2: int, count: int,
+            min_dist: int = 2, seed: Optional[int] = None) -> List[Coord]:
+    """Up to count random tiles in the rectangle, each at least min_dist apart
+
+    Dart-throwing Poisson-disk sampling: accepted points are bucketed in a grid
+    of min_dist-sized cells, so each candidate is only checked against its
+    neighbouring cells. Returns fewer points if the area fills up.
+    """
+    rng = random.Random(seed)
+    min_dist = max(1, min_dist)
+    min_dist_sq = min_dist * min_dist
+    cells = {}
+    points = []
+
+    attempts = count * 30
+    while len(points) < count and attempts:
+        attempts -= 1
+        x = rng.randint(x1, x2)
+        y = rng.randint(y1, y2)
+        cx, cy = x // min_dist, y // min_dist
+        neighbours = (p for nx in (cx - 1, cx, cx + 1) for ny in (cy - 1, cy, cy + 1)
+                      for p in cells.get((nx, ny), ()))
+        if any((px - x) ** 2 + (py - y) ** 2 < min_dist_sq for px, py in neighbours):
+            continue
+
+        cells.setdefault((cx, cy), []).append((x, y))
+        points.append((x, y))
+
+    return points
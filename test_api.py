@@ -7,6 +7,18 @@ This script tests if your API key is working correctly.
 import requests
 import json
 import os
+import functools
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@functools.lru_cache(maxsize=1)
+def _api():
+    """API client shared by both tests, so they reuse one HTTPS session"""
+    from generator import OpenRouterAPI
+    return OpenRouterAPI(os.getenv("OPENROUTER_API_KEY"))
 
 def test_api_connection():
     """Test the OpenRouter API connection"""
@@ -42,15 +54,17 @@ def test_api_connection():
         
         print("🔄 Testing connection to anthropic/claude-3.5-sonnet...")
         
-        response = requests.post(
+        # Encoded up front - headers already carry the JSON content type
+        body = orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode("utf-8")
+        response = _api().session.post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers=headers,
-            json=payload,
+            data=body,
             timeout=30
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content) if orjson is not None else response.json()
             message = result["choices"][0]["message"]["content"]
             print(f"✅ API connection successful!")
             print(f"📝 Response: {message}")
@@ -83,8 +97,10 @@ def test_scenario_generation():
             print("❌ No API key found")
             return False
         
-        # Initialize generator
+        # Initialize generator, reusing the connection from the connection test
         generator = ScenarioGenerator(api_key)
+        generator.api.close()
+        generator.api = _api()
         
         # Create a simple test config
         test_config = ScenarioConfig(
@@ -3,16 +3,39 @@ Scenario Viewer - Displays the contents of an AoE2 scenario file
 Supports both .aoe2scenario files and .gpv (encoded campaign) files
 """
 import sys
-import io
 import os
 import base64
 import struct
+import re
 import tempfile
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+from collections import defaultdict
+# Scenario text is often non-ASCII; switch stdout to UTF-8 in place unless it already is
+if sys.stdout.encoding.lower().replace('-', '') != 'utf8':
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
 from AoE2ScenarioParser.scenarios.aoe2_de_scenario import AoE2DEScenario
 from AoE2ScenarioParser.datasets.players import PlayerId
 
+PLAYER_IDS = tuple(PlayerId)
+
+try:
+    from AoE2ScenarioParser.datasets.units import UnitInfo
+    from AoE2ScenarioParser.datasets.buildings import BuildingInfo
+    from AoE2ScenarioParser.datasets.heroes import HeroInfo
+    from AoE2ScenarioParser.datasets.other import OtherInfo
+    NAME_DATASETS = (UnitInfo, BuildingInfo, HeroInfo, OtherInfo)
+except ImportError:
+    # Without the datasets units are shown as "Unit ID <n>"
+    NAME_DATASETS = ()
+
+GPV_COPY_CHUNK = 1 << 20
+
+# Payload size and extra field following the 'esaB' signature of a .gpv file
+_GPV_HEADER = struct.Struct('<II')
+
+# Printable ASCII sequences of 10+ chars
+_PRINTABLE_RE = re.compile(b'[\x20-\x7e]{10,}')
+
 
 def view_gpv_info(filepath):
     """Display information about a .gpv file"""
@@ -24,9 +47,9 @@ def view_gpv_info(filepath):
     print("=" * 60)
 
     if content[:4] == b'esaB':
-        payload_size = struct.unpack('<I', content[4:8])[0]
-        extra = struct.unpack('<I', content[8:12])[0]
-        data = content[12:]
+        payload_size, extra = _GPV_HEADER.unpack_from(content, 4)
+        # A view rather than a copy of the payload - only 64 bytes are shown
+        data = memoryview(content)[12:]
 
         print(f"\nFile Format: GPV (encrypted/encoded campaign)")
         print(f"Header Signature: 'esaB' (reversed 'Base')")
@@ -53,21 +76,26 @@ def decode_gpv_file(filepath):
     Returns path to decoded temp file or None if unable to decode.
     """
     with open(filepath, 'rb') as f:
-        content = f.read()
-
-    # Check for 'esaB' header (reversed 'Base')
-    if content[:4] == b'esaB':
         # Header: 4 bytes signature + 4 bytes size + 4 bytes extra
-        payload_size = struct.unpack('<I', content[4:8])[0]
-        data = content[12:12+payload_size]
+        header = f.read(12)
+
+        # Check for 'esaB' header (reversed 'Base')
+        if header[:4] != b'esaB':
+            return None
+        payload_size, _ = _GPV_HEADER.unpack_from(header, 4)
 
         # The data appears to be encrypted/encoded - try various decodings
-        # For now, return the raw data to see if AoE2ScenarioParser can handle it
-        temp_file = tempfile.NamedTemporaryFile(suffix='.aoe2scenario', delete=False)
-        temp_file.write(data)
-        temp_file.close()
+        # For now, return the raw data to see if AoE2ScenarioParser can handle it.
+        # Copied in chunks, so the payload is never held in memory as a whole
+        with tempfile.NamedTemporaryFile(suffix='.aoe2scenario', delete=False) as temp_file:
+            remaining = payload_size
+            while remaining:
+                chunk = f.read(min(GPV_COPY_CHUNK, remaining))
+                if not chunk:
+                    break
+                temp_file.write(chunk)
+                remaining -= len(chunk)
         return temp_file.name
-    return None
 
 
 def view_raw_scenario_info(filepath):
@@ -86,18 +114,24 @@ def view_raw_scenario_info(filepath):
 
     # Try to find readable strings in the file
     print(f"\n--- EMBEDDED STRINGS ---")
-    # Look for string patterns
-    import re
-    # Find printable ASCII sequences of 10+ chars
-    strings = re.findall(b'[\x20-\x7e]{10,}', content)
+    # Print the first 50 distinct strings; the scan stops as soon as they
+    # are found instead of running to the end of the file
     seen = set()
-    for s in strings[:50]:  # Limit output
-        decoded = s.decode('ascii')
-        if decoded not in seen and not decoded.isspace():
-            seen.add(decoded)
-            if len(decoded) > 80:
-                decoded = decoded[:77] + "..."
-            print(f"  {decoded}")
+    shown = 0
+    for match in _PRINTABLE_RE.finditer(content):
+        raw = match.group()
+        if raw in seen:
+            continue
+        seen.add(raw)
+        decoded = raw.decode('ascii')
+        if decoded.isspace():
+            continue
+        if len(decoded) > 80:
+            decoded = decoded[:77] + "..."
+        print(f"  {decoded}")
+        shown += 1
+        if shown >= 50:  # Limit output
+            break
 
     print("\n" + "=" * 60)
     return None  # Signal we used raw mode
@@ -132,119 +166,152 @@ def load_scenario(filepath):
             return "raw_mode"
 
 
-# Get scenario path from command line or use default
-if len(sys.argv) > 1:
-    scenario_path = sys.argv[1]
-else:
-    scenario_path = "test_battle.aoe2scenario"
-
-# Check if file exists
-if not os.path.exists(scenario_path):
-    print(f"Error: File not found: {scenario_path}")
-    print("\nAvailable scenario files in current directory:")
-    for f in os.listdir('.'):
-        if f.endswith('.aoe2scenario') or f.endswith('.gpv'):
-            print(f"  - {f}")
-    sys.exit(1)
-
-# Load the scenario file
-scenario = load_scenario(scenario_path)
-if scenario is None:
-    sys.exit(1)
-if scenario in ("raw_mode", "gpv_failed"):
-    sys.exit(0)  # Already printed info
-
-# Get managers
-unit_manager = scenario.unit_manager
-trigger_manager = scenario.trigger_manager
-map_manager = scenario.map_manager
-
-print("=" * 60)
-print(f"SCENARIO: {scenario_path}")
-print("=" * 60)
-
-# --- MAP INFO ---
-print(f"\n--- MAP INFO ---")
-print(f"Map Size: {map_manager.map_size} x {map_manager.map_size}")
-
-# --- UNITS BY PLAYER ---
-print(f"\n--- UNITS ---")
-
-# Get units for each player
-for player_id in PlayerId:
+def build_unit_names():
+    """Map every known unit, building, hero and object ID to its name
+
+    Built once so each unit type is a dict lookup instead of a scan of every
+    dataset. The first dataset that knows an ID wins.
+    """
+    id2name = {}
+    for dataset in NAME_DATASETS:
+        try:
+            for item in dataset:
+                id2name.setdefault(item.ID, item.name)
+        except Exception:
+            pass
+    return id2name
+
+
+_type_names = {}
+
+
+def _type_name(type_value):
+    """Display name of a condition or effect type, cached per value"""
+    name = _type_names.get(type_value)
+    if name is None:
+        name = type_value.name if hasattr(type_value, 'name') else str(type_value)
+        _type_names[type_value] = name
+    return name
+
+
+def _write_lines(lines):
+    """Write buffered output lines with a single call and empty the buffer"""
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        lines.clear()
+
+
+def render_scenario(scenario, scenario_path, id2name):
+    """Print the map, units and triggers of a loaded scenario"""
+    # Get managers
+    unit_manager = scenario.unit_manager
+    trigger_manager = scenario.trigger_manager
+    map_manager = scenario.map_manager
+
+    print("=" * 60)
+    print(f"SCENARIO: {scenario_path}")
+    print("=" * 60)
+
+    # --- MAP INFO ---
+    print(f"\n--- MAP INFO ---")
+    print(f"Map Size: {map_manager.map_size} x {map_manager.map_size}")
+
+    # --- UNITS BY PLAYER ---
+    print(f"\n--- UNITS ---")
+
+    # Unit and trigger lines are collected and written once per section
+    # instead of one print() call each
+    out = []
+
+    # Get units for each player, skipping players without any
     try:
-        units = unit_manager.get_player_units(player_id)
-        if units:
-            print(f"\n  Player: {player_id.name} ({len(units)} units)")
-            print("  " + "-" * 40)
-
-            # Count unit types
-            unit_counts = {}
-            for unit in units:
-                unit_type = unit.unit_const
-                if unit_type not in unit_counts:
-                    unit_counts[unit_type] = []
-                unit_counts[unit_type].append(unit)
-
-            for unit_type, unit_list in unit_counts.items():
-                # Try to get unit name
-                name = f"Unit ID {unit_type}"
-                try:
-                    from AoE2ScenarioParser.datasets.units import UnitInfo
-                    from AoE2ScenarioParser.datasets.buildings import BuildingInfo
-                    from AoE2ScenarioParser.datasets.heroes import HeroInfo
-                    from AoE2ScenarioParser.datasets.other import OtherInfo
-
-                    for dataset in [UnitInfo, BuildingInfo, HeroInfo, OtherInfo]:
-                        try:
-                            for item in dataset:
-                                if item.ID == unit_type:
-                                    name = item.name
-                                    break
-                        except:
-                            pass
-                        if name != f"Unit ID {unit_type}":
-                            break
-                except:
-                    pass
-
-                # Show positions
-                positions = [(int(u.x), int(u.y)) for u in unit_list]
-                pos_str = str(positions[:5])
-                if len(positions) > 5:
-                    pos_str = pos_str[:-1] + ", ...]"
-                print(f"    {name}: {len(unit_list)}x at {pos_str}")
-    except:
-        pass
-
-# --- TRIGGERS ---
-print(f"\n--- TRIGGERS ({len(trigger_manager.triggers)} total) ---")
-
-for i, trigger in enumerate(trigger_manager.triggers):
-    print(f"\n  [{i+1}] {trigger.name}")
-    print(f"      Enabled: {trigger.enabled}")
-
-    # Conditions
-    if trigger.conditions:
-        print(f"      Conditions ({len(trigger.conditions)}):")
-        for cond in trigger.conditions:
-            cond_type = cond.condition_type
-            cond_name = cond_type.name if hasattr(cond_type, 'name') else str(cond_type)
-            print(f"        - {cond_name}")
-
-    # Effects
-    if trigger.effects:
-        print(f"      Effects ({len(trigger.effects)}):")
-        for effect in trigger.effects:
-            effect_type = effect.effect_type
-            effect_name = effect_type.name if hasattr(effect_type, 'name') else str(effect_type)
-            # Try to get message if it's a display instruction
-            msg = ""
-            if hasattr(effect, 'message') and effect.message:
-                msg_text = str(effect.message)
-                msg = f' - "{msg_text[:50]}..."' if len(msg_text) > 50 else f' - "{msg_text}"'
-            print(f"        - {effect_name}{msg}")
-
-print("\n" + "=" * 60)
-print("END OF SCENARIO")
-print("=" * 60)
+        player_units = [(player_id, units) for player_id in PLAYER_IDS
+                        if (units := unit_manager.get_player_units(player_id))]
+    except Exception as e:
+        print(f"Warning: Could not read units: {e}")
+        player_units = []
+
+    for player_id, units in player_units:
+        out.append(f"\n  Player: {player_id.name} ({len(units)} units)")
+        out.append("  " + "-" * 40)
+
+        # Count unit types
+        unit_counts = defaultdict(list)
+        for unit in units:
+            unit_counts[unit.unit_const].append(unit)
+
+        for unit_type, unit_list in unit_counts.items():
+            name = id2name.get(unit_type, f"Unit ID {unit_type}")
+
+            # Show the first five positions
+            pos_str = ", ".join(f"({int(u.x)}, {int(u.y)})" for u in unit_list[:5])
+            if len(unit_list) > 5:
+                pos_str += ", ..."
+            out.append(f"    {name}: {len(unit_list)}x at [{pos_str}]")
+    _write_lines(out)
+
+    # --- TRIGGERS ---
+    print(f"\n--- TRIGGERS ({len(trigger_manager.triggers)} total) ---")
+
+    for i, trigger in enumerate(trigger_manager.triggers):
+        out.append(f"\n  [{i+1}] {trigger.name}")
+        out.append(f"      Enabled: {trigger.enabled}")
+
+        # Conditions
+        if trigger.conditions:
+            out.append(f"      Conditions ({len(trigger.conditions)}):")
+            for cond in trigger.conditions:
+                out.append(f"        - {_type_name(cond.condition_type)}")
+
+        # Effects
+        if trigger.effects:
+            out.append(f"      Effects ({len(trigger.effects)}):")
+            for effect in trigger.effects:
+                effect_name = _type_name(effect.effect_type)
+                # Try to get message if it's a display instruction
+                msg = ""
+                if hasattr(effect, 'message') and effect.message:
+                    msg_text = str(effect.message)
+                    msg = f' - "{msg_text[:50]}..."' if len(msg_text) > 50 else f' - "{msg_text}"'
+                out.append(f"        - {effect_name}{msg}")
+    _write_lines(out)
+
+    print("\n" + "=" * 60)
+    print("END OF SCENARIO")
+    print("=" * 60)
+
+
+def view_scenarios(scenario_paths):
+    """Display each scenario in argument order"""
+    # Check the files exist
+    missing = [path for path in scenario_paths if not os.path.exists(path)]
+    if missing:
+        for path in missing:
+            print(f"Error: File not found: {path}")
+        print("\nAvailable scenario files in current directory:")
+        for f in os.listdir('.'):
+            if f.endswith('.aoe2scenario') or f.endswith('.gpv'):
+                print(f"  - {f}")
+        return 1
+
+    # The unit name table is built once for all files. Each file is parsed
+    # only when its turn comes, so the parser's progress output stays next
+    # to the scenario it belongs to and one parsed scenario is held at a time
+    id2name = build_unit_names()
+    exit_code = 0
+    for scenario_path in scenario_paths:
+        # Load the scenario file
+        scenario = load_scenario(scenario_path)
+        if scenario is None:
+            exit_code = 1
+            continue
+        if scenario in ("raw_mode", "gpv_failed"):
+            continue  # Already printed info
+        render_scenario(scenario, scenario_path, id2name)
+    return exit_code
+
+
+if __name__ == "__main__":
+    # Get scenario paths from command line or use default
+    paths = sys.argv[1:] or ["test_battle.aoe2scenario"]
+    sys.exit(view_scenarios(paths))